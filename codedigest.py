@@ -20,6 +20,7 @@ Command Line Usage:
     python3 codedigest.py --path /repo --output digest.json --include-ext .tex .bib
     python3 codedigest.py --path /repo --output digest.json --include-ext .cfg .conf --exclude-dir .venv .log
     python3 codedigest.py --path /repo --output digest.xml --no-summary --no-structure
+    python3 codedigest.py --path /repo --output digest.json.gz
 
 Features:
     - Recursive folder walk with exclusion support (.git, __pycache__, etc.)
@@ -30,172 +31,613 @@ Features:
     - CLI options to skip mentionning "other" binaries, include only "text" files
     - CLI options to override extensions or folders to include/exclude
     - Optional timestamp insertion in output filename
+    - On-the-fly compression when the output ends in .gz or .zst
 
 External dependency:
     - Requires PyYAML (install with: pip install PyYAML)
+    - Uses orjson for faster JSON output when installed (optional: pip install orjson)
+    - Uses zstandard for .zst compressed output (optional: pip install zstandard)
 
 """
 
 import os
+import io
+import mmap
+import operator
+import codecs
 import argparse
 import mimetypes
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import json
+import re
+import shutil
+import tempfile
 import yaml
 import datetime
-from collections import defaultdict
-from pathlib import Path
+import gzip
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    from yaml import CSafeDumper as YamlDumper  # libyaml-backed emitter
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+
+try:
+    import orjson  # optional, much faster JSON encoder
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard  # optional, for .zst output
+except ImportError:
+    zstandard = None
 
 __version__ = "0.1"
 
-class CDATA(str):
-    pass
-
-# Patch ElementTree to support CDATA
-ET._original_serialize_xml = ET._serialize_xml
-def _serialize_xml(write, elem, qnames, namespaces, short_empty_elements=True, **kwargs):
-    if elem.text and isinstance(elem.text, CDATA):
-        write(f"<{elem.tag}>")
-        write(f"<![CDATA[{elem.text}]]>")
-        for e in elem:
-            ET._original_serialize_xml(write, e, qnames, namespaces, short_empty_elements=short_empty_elements)
-        write(f"</{elem.tag}>")
-    else:
-        ET._original_serialize_xml(write, elem, qnames, namespaces, short_empty_elements=short_empty_elements)
-ET._serialize_xml = _serialize_xml
-
-def detect_file_type(file_path, include_exts):
-    """Return (file_type, ext) or (None, ext) if excluded."""
-    ext = os.path.splitext(file_path)[1].lower()
-    if include_exts and ext not in include_exts:
-        return None, ext
-    if ext in {'.py', '.md', '.yaml', '.yml', '.sh', '.csv', '.txt', '.log', '.tex', '.bib'}:
-        return "text", ext
-    mime, _ = mimetypes.guess_type(file_path)
-    if mime:
-        if mime.startswith("image/"):    
-            return "picture", ext
-        if mime.startswith("audio/"):    
-            return "audio",   ext
-        if mime.startswith("video/"):    
-            return "video",   ext
-        if mime.startswith("application/zip") or ext in {'.zip', '.tar', '.gz'}:
-            return "archive", ext
-    return "other", ext
-
-def prettify(elem):
-    """Return a pretty-printed XML string for the Element."""
-    rough = ET.tostring(elem, 'utf-8')
-    reparsed = minidom.parseString(rough)
-    return reparsed.toprettyxml(indent="  ")
-
-def create_summary_block(stats_dict, ext_stats):
-    summary = ET.Element('summary')
-    for type_name, count in stats_dict.items():
-        ET.SubElement(summary, 'stat', type=type_name).text = str(count)
-    ext_block = ET.SubElement(summary, 'extension_stats')
-    for ext, count in sorted(ext_stats.items()):
-        ET.SubElement(ext_block, 'ext', name=ext).text = str(count)
-    return summary
-
-def create_structure_block(paths_list):
-    structure = ET.Element('directory_structure')
-    for path in sorted(paths_list):
-        ET.SubElement(structure, 'entry').text = path
-    return structure
-
-def create_code_digest_tree(repo_path, include_exts, exclude_dirs,
-                            skip_other, only_text, include_summary=True, include_structure=True):
-    stats = defaultdict(int)
-    ext_stats = defaultdict(int)
-    paths = []
-    repo_name = os.path.basename(os.path.abspath(repo_path))
-    root = ET.Element('repository', name=repo_name)
+READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+READ_AHEAD = 2 * READ_WORKERS   # text file reads in flight ahead of the writer
+MMAP_THRESHOLD = 1 << 20   # text files above this size are memory-mapped
+CHUNK_SIZE = 1 << 20
+O_RDONLY = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+
+TEXT_EXTS = frozenset({'.py', '.md', '.yaml', '.yml', '.sh', '.csv', '.txt', '.log', '.tex', '.bib'})
+
+def _build_ext_types():
+    """Map extensions to file types once, from the system MIME database."""
+    mimetypes.init()
+    ext_types = {}
+    for ext, mime in mimetypes.types_map.items():
+        if mime.startswith("image/"):
+            ext_types[ext.lower()] = "picture"
+        elif mime.startswith("audio/"):
+            ext_types[ext.lower()] = "audio"
+        elif mime.startswith("video/"):
+            ext_types[ext.lower()] = "video"
+        elif mime.startswith("application/zip"):
+            ext_types[ext.lower()] = "archive"
+    ext_types.update(dict.fromkeys(('.zip', '.tar', '.gz'), "archive"))
+    ext_types.update(dict.fromkeys(TEXT_EXTS, "text"))
+    return ext_types
+
+EXT_TYPES = _build_ext_types()
+
+def build_classifier(include_exts, skip_other=False, only_text=False):
+    """Return a lookup mapping an extension to its file type, or None if excluded.
+
+    This is the single classification path: the include filter and the
+    --skip-other/--only-text switches are folded into the table once per
+    run, so the walk pays a single dict lookup per file and no flag tests.
+    """
+    def keep(file_type):
+        return not ((skip_other and file_type == "other") or (only_text and file_type != "text"))
+
+    if include_exts:
+        types = {ext: EXT_TYPES.get(ext, "other") for ext in include_exts}
+        return {ext: t for ext, t in types.items() if keep(t)}.get
+    table = {ext: t for ext, t in EXT_TYPES.items() if keep(t)}
+    if not keep("other"):
+        return table.get
+    return lambda ext: table.get(ext, "other")
+
+class StreamingWriter(ABC):
+    """Base class for writers that emit the digest incrementally.
+
+    Folders and files are written as soon as they are read, so memory stays
+    bounded by the read-ahead window instead of the whole repository.
+    """
+
+    def __init__(self, f, include_summary=True, include_structure=True):
+        self.f = f
+        self.include_summary = include_summary
+        self.include_structure = include_structure
+        self.folder = None
+        self.folder_count = 0
+        self.file_count = 0
+
+    def write(self, text):
+        self.f.write(text.encode('utf-8'))
+
+    @abstractmethod
+    def begin_repo(self, name):
+        pass
+
+    def begin_folder(self, rel_dir):
+        self.folder = rel_dir
+        self.file_count = 0
+
+    @abstractmethod
+    def emit_file(self, rel_path, file_type, code=None, error=None):
+        pass
+
+    def end_folder(self):
+        self.folder_count += 1
+
+    @abstractmethod
+    def end_repo(self, stats, ext_stats, paths):
+        pass
+
+# code points XML 1.0 forbids; U+FFFE/U+FFFF are matched by their UTF-8 bytes
+_XML_ILLEGAL = re.compile(rb'[\x00-\x08\x0b\x0c\x0e-\x1f]|\xef\xbf[\xbe\xbf]')
+_XML_ILLEGAL_STR = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+def _xml_attr(value):
+    """Quote an attribute value, replacing characters XML cannot carry with U+FFFD."""
+    return quoteattr(_XML_ILLEGAL_STR.sub('\ufffd', value))
+
+def _xml_text(value):
+    """Escape element text, replacing characters XML cannot carry with U+FFFD."""
+    return escape(_XML_ILLEGAL_STR.sub('\ufffd', value))
+
+def _cdata_chunks(chunks):
+    """Yield byte chunks safe for CDATA: every ']]>' is split across two
+    sections and characters XML forbids are replaced with U+FFFD."""
+    carry = b''
+    for chunk in chunks:
+        chunk = carry + chunk
+        # hold back a tail the next chunk may complete into ']]>' or U+FFFE/F
+        keep = next((len(t) for t in (b']]', b'\xef\xbf', b']', b'\xef')
+                     if chunk.endswith(t)), 0)
+        carry = chunk[len(chunk) - keep:]
+        body = _XML_ILLEGAL.sub(b'\xef\xbf\xbd', chunk[:len(chunk) - keep])
+        yield body.replace(b']]>', b']]]]><![CDATA[>')
+    yield carry
+
+class XmlWriter(StreamingWriter):
+    """Stream the digest as XML, spooling folders until the summary is known."""
+
+    def _write_header(self):
+        self.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        self.write(f'<repository name={_xml_attr(self.name)}>\n')
+
+    def _spool(self, text):
+        self.spool.write(text.encode('utf-8'))
+
+    def begin_repo(self, name):
+        self.name = name
+        if self.include_summary or self.include_structure:
+            self.spool = tempfile.TemporaryFile('w+b')
+        else:
+            # nothing goes ahead of the folders, so write them in place
+            self._write_header()
+            self.spool = self.f
+
+    def emit_file(self, rel_path, file_type, code=None, error=None):
+        write = self._spool
+        if not self.file_count:
+            write(f'  <folder path={_xml_attr(self.folder)}>\n')
+        attrs = f'path={_xml_attr(rel_path)} type={_xml_attr(file_type)}'
+        if error is not None:
+            write(f'    <file {attrs} error={_xml_attr(error)} />\n')
+        elif code is not None:
+            write(f'    <file {attrs}>\n      <code><![CDATA[')
+            # content goes out as the raw UTF-8 bytes that were read
+            chunks = code.iter_bytes() if isinstance(code, MappedText) else (code,)
+            for chunk in _cdata_chunks(chunks):
+                self.spool.write(chunk)
+            write(']]></code>\n    </file>\n')
+        else:
+            write(f'    <file {attrs} />\n')
+        self.file_count += 1
 
-    for dirpath, dirnames, filenames in os.walk(repo_path):
-        rel_dir = os.path.relpath(dirpath, repo_path)
-        if any(part in exclude_dirs for part in Path(rel_dir).parts):
-            continue
-        dirnames[:] = [d for d in dirnames if d not in exclude_dirs]
-        paths.append(rel_dir + '/')
-        folder_elem = ET.SubElement(root, 'folder', path=rel_dir)
-
-        for fname in filenames:
-            file_path = os.path.join(dirpath, fname)
-            rel_path = os.path.relpath(file_path, repo_path)
-            file_type, ext = detect_file_type(file_path, include_exts)
-            if file_type is None:                   continue
-            if skip_other and file_type == "other": continue
-            if only_text and file_type != "text":   continue
-
-            paths.append(rel_path)
-            stats[file_type] += 1
-            ext_stats[ext] += 1
-            file_elem = ET.SubElement(folder_elem, 'file', path=rel_path, type=file_type)
-            if file_type == "text":
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    code = ET.SubElement(file_elem, 'code')
-                    code.text = CDATA(content)
-                except Exception as e:
-                    file_elem.set('error', f"Cannot read: {e}")
-
-    if include_structure:
-        root.insert(0, create_structure_block(paths))
-    if include_summary:
-        root.insert(0, create_summary_block(stats, ext_stats))
-    return root
-
-def create_code_digest_dict(repo_path, include_exts, exclude_dirs,
-                            skip_other, only_text, include_summary=True, include_structure=True):
-    stats = defaultdict(int)
-    ext_stats = defaultdict(int)
-    paths = []
-    repo_name = os.path.basename(os.path.abspath(repo_path))
-    result = {'repository': {'name': repo_name, 'folders': {}}}
+    def end_folder(self):
+        if self.file_count:
+            self._spool('  </folder>\n')
+        else:
+            self._spool(f'  <folder path={_xml_attr(self.folder)} />\n')
+        super().end_folder()
+
+    def _write_summary(self, stats, ext_stats):
+        write = self.write
+        write('  <summary>\n')
+        for type_name, count in stats.items():
+            write(f'    <stat type={_xml_attr(type_name)}>{count}</stat>\n')
+        if ext_stats:
+            write('    <extension_stats>\n')
+            for ext, count in sorted(ext_stats.items()):
+                write(f'      <ext name={_xml_attr(ext)}>{count}</ext>\n')
+            write('    </extension_stats>\n')
+        else:
+            write('    <extension_stats />\n')
+        write('  </summary>\n')
+
+    def _write_structure(self, paths):
+        write = self.write
+        if not paths:
+            write('  <directory_structure />\n')
+            return
+        write('  <directory_structure>\n')
+        for path in paths:
+            write(f'    <entry>{_xml_text(path)}</entry>\n')
+        write('  </directory_structure>\n')
+
+    def end_repo(self, stats, ext_stats, paths):
+        f = self.f
+        if self.spool is not f:
+            self._write_header()
+            if self.include_summary:
+                self._write_summary(stats, ext_stats)
+            if self.include_structure:
+                self._write_structure(paths)
+            self.spool.seek(0)
+            shutil.copyfileobj(self.spool, f)
+            self.spool.close()
+        self.write('</repository>\n')
+
+def _indent(data, prefix):
+    """Prefix every non-empty line of encoded text."""
+    return re.sub(rb'(?m)^(?=.)', prefix, data)
+
+def _json_dumps(obj):
+    """Encode obj to UTF-8 like json.dumps(indent=2, ensure_ascii=False), via orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+class JsonWriter(StreamingWriter):
+    """Stream the digest as JSON, laid out like ``json.dump(indent=2)``."""
+
+    def _dumps(self, obj, prefix):
+        return _json_dumps(obj).replace(b'\n', b'\n' + prefix)
+
+    def begin_repo(self, name):
+        self.f.write(b'{\n  "repository": {\n    "name": %s,\n    "folders": {' % _json_dumps(name))
+
+    def emit_file(self, rel_path, file_type, code=None, error=None):
+        f = self.f
+        if not self.file_count:
+            sep = b',' if self.folder_count else b''
+            f.write(b'%s\n      %s: {\n        "files": [' % (sep, _json_dumps(self.folder)))
+        rec = {'path': rel_path, 'type': file_type}
+        if error is not None:
+            rec['error'] = error
+        elif code is not None and not isinstance(code, MappedText):
+            rec['code'] = code.decode('utf-8')
+        sep = b',' if self.file_count else b''
+        body = self._dumps(rec, b' ' * 10)
+        if isinstance(code, MappedText):
+            # reopen the record and encode the string body chunk by chunk
+            head = body.rpartition(b'\n')[0]
+            f.write(b'%s\n          %s,\n            "code": "' % (sep, head))
+            for chunk in code:
+                f.write(_json_dumps(chunk)[1:-1])
+            f.write(b'"\n          }')
+        else:
+            f.write(b'%s\n          %s' % (sep, body))
+        self.file_count += 1
 
-    for dirpath, dirnames, filenames in os.walk(repo_path):
-        rel_dir = os.path.relpath(dirpath, repo_path)
-        if any(part in exclude_dirs for part in Path(rel_dir).parts):
+    def end_folder(self):
+        if self.file_count:
+            self.f.write(b'\n        ]\n      }')
+        else:
+            sep = b',' if self.folder_count else b''
+            self.f.write(b'%s\n      %s: {\n        "files": []\n      }' % (sep, _json_dumps(self.folder)))
+        super().end_folder()
+
+    def end_repo(self, stats, ext_stats, paths):
+        f = self.f
+        f.write(b'\n    }' if self.folder_count else b'}')
+        if self.include_summary:
+            f.write(b',\n    "summary": %s' % self._dumps(dict(stats), b' ' * 4))
+            f.write(b',\n    "extension_stats": %s' % self._dumps(dict(ext_stats), b' ' * 4))
+        if self.include_structure:
+            f.write(b',\n    "directory_structure": %s' % self._dumps(paths, b' ' * 4))
+        f.write(b'\n  }\n}')
+
+class YamlWriter(StreamingWriter):
+    """Stream the digest as a single YAML document, one file record at a time.
+
+    Keys follow the JSON layout; sorting them would require the whole
+    repository in memory.
+    """
+
+    def _dump(self, obj, prefix):
+        return _indent(yaml.dump(obj, Dumper=YamlDumper, allow_unicode=True, encoding='utf-8',
+                                 sort_keys=False, default_flow_style=False), prefix)
+
+    def begin_repo(self, name):
+        self.f.write(self._dump({'repository': {'name': name}}, b''))
+
+    def emit_file(self, rel_path, file_type, code=None, error=None):
+        if not self.folder_count and not self.file_count:
+            self.f.write(b'  folders:\n')
+        rec = {'path': rel_path, 'type': file_type}
+        if error is not None:
+            rec['error'] = error
+        elif code is not None:
+            rec['code'] = str(code) if isinstance(code, MappedText) else code.decode('utf-8')
+        if self.file_count:
+            self.f.write(self._dump([rec], b' ' * 6))
+        else:
+            self.f.write(self._dump({self.folder: {'files': [rec]}}, b' ' * 4))
+        self.file_count += 1
+
+    def end_folder(self):
+        if not self.file_count:
+            if not self.folder_count:
+                self.f.write(b'  folders:\n')
+            self.f.write(self._dump({self.folder: {'files': []}}, b' ' * 4))
+        super().end_folder()
+
+    def end_repo(self, stats, ext_stats, paths):
+        if not self.folder_count:
+            self.f.write(b'  folders: {}\n')
+        tail = {}
+        if self.include_summary:
+            tail['summary'] = dict(stats)
+            tail['extension_stats'] = dict(ext_stats)
+        if self.include_structure:
+            tail['directory_structure'] = paths
+        if tail:
+            self.f.write(self._dump(tail, b'  '))
+
+WRITERS = {'.xml': XmlWriter, '.json': JsonWriter, '.yaml': YamlWriter, '.yml': YamlWriter}
+
+_entry_name = operator.attrgetter('name')
+
+def _scan_tree(repo_path, exclude_dirs):
+    """Yield (rel_dir, file entries) for each folder, depth first like os.walk.
+
+    DirEntry objects carry the d_type from readdir, so telling files from
+    folders costs no extra stat on most filesystems. Siblings are visited in
+    name order (folders keyed as 'name/'), which makes the output
+    deterministic and the collected path list nearly sorted.
+    """
+    prefix_len = len(os.path.join(repo_path, ''))
+    stack = [repo_path]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError:
             continue
-        dirnames[:] = [d for d in dirnames if d not in exclude_dirs]
-        paths.append(rel_dir + '/')
-        folder = result['repository']['folders'].setdefault(rel_dir, {'files': []})
-
-        for fname in filenames:
-            file_path = os.path.join(dirpath, fname)
-            rel_path = os.path.relpath(file_path, repo_path)
-            file_type, ext = detect_file_type(file_path, include_exts)
-            if file_type is None:                   continue
-            if skip_other and file_type == "other": continue
-            if only_text and file_type != "text":   continue
-
-            paths.append(rel_path)
-            stats[file_type] += 1
-            ext_stats[ext] += 1
-            rec = {'path': rel_path, 'type': file_type}
-            if file_type == "text":
+        subdirs, files = [], []
+        files_append = files.append
+        for entry in entries:
+            # like os.walk, an entry whose type cannot be read counts as a file
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                # like os.walk, list but never descend into symlinked folders
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        rec['code'] = f.read()
-                except Exception as e:
-                    rec['error'] = f"Cannot read: {e}"
-            folder['files'].append(rec)
+                    is_symlink = entry.is_symlink()
+                except OSError:
+                    is_symlink = False
+                if entry.name not in exclude_dirs and not is_symlink:
+                    subdirs.append(entry.path)
+            else:
+                files_append(entry)
+        files.sort(key=_entry_name)
+        subdirs.sort(key=lambda path: path + '/', reverse=True)
+        stack.extend(subdirs)
+        yield (dirpath[prefix_len:] if dirpath != repo_path else '.'), files
+
+def _is_same_file(entry, st):
+    try:
+        return entry.stat(follow_symlinks=False).st_dev == st.st_dev
+    except OSError:
+        return False
+
+def iter_repository(repo_path, include_exts, exclude_dirs, skip_other, only_text,
+                    skip_file=None):
+    """Yield (rel_dir, files) per folder, files being (rel_path, file_type, ext, file_path).
+
+    skip_file is the os.stat() of a file to leave out, typically the digest
+    being written when it sits inside the scanned tree.
+    """
+    prefix_len = len(os.path.join(repo_path, ''))
+    classify = build_classifier(include_exts, skip_other, only_text)
+    skip_ino = skip_file.st_ino if skip_file is not None else None
+    # _scan_tree never descends into excluded folders, so every ancestor is allowed
+    for rel_dir, entries in _scan_tree(repo_path, exclude_dirs):
+        files = []
+        files_append = files.append
+        for entry in entries:
+            # the inode comes from readdir; st_dev is only checked on a match
+            if skip_ino is not None and entry.inode() == skip_ino and _is_same_file(entry, skip_file):
+                continue
+            # same result as os.path.splitext(name)[1], without the call
+            head, _, tail = entry.name.rpartition('.')
+            ext = '.' + tail.lower() if head.strip('.') else ''
+            file_type = classify(ext)
+            if file_type is None:
+                continue
+            file_path = entry.path
+            files_append((file_path[prefix_len:], file_type, ext, file_path))
+        yield rel_dir, files
+
+class MappedText:
+    """Text of a large file, decoded chunk by chunk from a memory map.
+
+    Iterating yields str chunks with universal newlines, like a text-mode
+    read, without ever holding the whole file as one string; iter_bytes()
+    yields the same text as UTF-8 bytes without decoding it. The file must
+    be mapped with open() first; use it as a context manager to unmap it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mm = None
+
+    def open(self):
+        """Map the file, raising OSError or ValueError if it is gone or empty."""
+        fd = os.open(self.path, O_RDONLY)
+        try:
+            self.mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        return self
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def validate(self):
+        """Raise UnicodeDecodeError unless the mapped file is valid UTF-8."""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        mm = self.mm
+        for pos in range(0, len(mm), CHUNK_SIZE):
+            decoder.decode(mm[pos:pos + CHUNK_SIZE])
+        decoder.decode(b'', final=True)
+
+    def iter_bytes(self):
+        mm = self.mm
+        pending_cr = False
+        for pos in range(0, len(mm), CHUNK_SIZE):
+            chunk = mm[pos:pos + CHUNK_SIZE]
+            if pending_cr:
+                chunk = b'\r' + chunk
+            # a trailing '\r' may be the first half of a '\r\n' pair
+            pending_cr = chunk.endswith(b'\r')
+            if pending_cr:
+                chunk = chunk[:-1]
+            yield chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        if pending_cr:
+            yield b'\n'
+
+    def __iter__(self):
+        # the file was validated when read; if it changed since, replace bad
+        # bytes rather than fail in the middle of a written record
+        mm = self.mm
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder('utf-8')('replace'), True)
+        for pos in range(0, len(mm), CHUNK_SIZE):
+            yield decoder.decode(mm[pos:pos + CHUNK_SIZE])
+        yield decoder.decode(b'', final=True)
+
+    def __str__(self):
+        return ''.join(self)
+
+def _read_text(file_path):
+    """Return (code, error) for a text file.
+
+    Small files cost one open, fstat and read each, bypassing the buffered
+    text-mode layers, and are returned as validated UTF-8 bytes so writers
+    can pass them through without a decode/encode round-trip; larger ones
+    are memory-mapped.
+    """
+    try:
+        fd = os.open(file_path, O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            if size > MMAP_THRESHOLD:
+                code = MappedText(file_path)
+                with code.open():  # validate up front so errors land on the record
+                    code.validate()
+                return code, None
+            data = os.read(fd, size + 1)
+            if len(data) > size:  # the file grew since fstat
+                data += b''.join(iter(lambda: os.read(fd, CHUNK_SIZE), b''))
+        finally:
+            os.close(fd)
+        if not data.isascii():
+            data.decode('utf-8')  # validate only; ASCII is always valid UTF-8
+        if b'\r' in data:  # universal newlines, as in text mode
+            data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        return data, None
+    except Exception as e:
+        return None, f"Cannot read: {e}"
 
-    if include_summary:
-        result['repository']['summary'] = dict(stats)
-        result['repository']['extension_stats'] = dict(ext_stats)
-    if include_structure:
-        result['repository']['directory_structure'] = sorted(paths)
+def write_code_digest(repo_path, writer, include_exts, exclude_dirs, skip_other, only_text,
+                      skip_file=None):
+    """Feed each folder and file of a single repository walk to writer.
 
-    return result
+    Return (stats, ext_stats) for the terminal summary.
+    """
+    counts = defaultdict(int)   # (file_type, ext) -> files, split into stats at the end
+    paths = []
+    # hot-loop names bound once as locals
+    paths_append = paths.append
+    emit_file = writer.emit_file
+    writer.begin_repo(os.path.basename(os.path.abspath(repo_path)))
+
+    # Writer calls queue up in walk order as (method, args, read future).
+    # Reads release the GIL, so a pool overlaps I/O latency across files and
+    # folders, while the window keeps only READ_AHEAD results in memory.
+    pending = deque()
+    pending_append = pending.append
+    popleft = pending.popleft
+    in_flight = 0
+
+    def drain(limit):
+        nonlocal in_flight
+        while pending and (in_flight > limit or pending[0][2] is None
+                           or len(pending) > 4 * READ_AHEAD):
+            method, args, future = popleft()
+            if future is None:
+                method(*args)
+                continue
+            in_flight -= 1
+            code, error = future.result()
+            if not isinstance(code, MappedText):
+                method(*args, code, error)
+                continue
+            # remap before the record starts, the file may be gone by now
+            try:
+                code.open()
+            except (OSError, ValueError) as e:
+                method(*args, None, f"Cannot read: {e}")
+                continue
+            with code:
+                method(*args, code, None)
+
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        submit = executor.submit
+        for rel_dir, files in iter_repository(repo_path, include_exts, exclude_dirs,
+                                              skip_other, only_text, skip_file):
+            paths_append(rel_dir + '/')
+            pending_append((writer.begin_folder, (rel_dir,), None))
+            for rel_path, file_type, ext, file_path in files:
+                paths_append(rel_path)
+                counts[file_type, ext] += 1
+                if file_type == "text":
+                    pending_append((emit_file, (rel_path, file_type), submit(_read_text, file_path)))
+                    in_flight += 1
+                    drain(READ_AHEAD)
+                else:
+                    pending_append((emit_file, (rel_path, file_type), None))
+            pending_append((writer.end_folder, (), None))
+            drain(READ_AHEAD)
+        drain(-1)
+
+    stats = defaultdict(int)
+    ext_stats = defaultdict(int)
+    for (file_type, ext), count in counts.items():
+        stats[file_type] += count
+        ext_stats[ext] += count
+
+    # sorted runs from the walk make this close to a linear merge, done in place
+    paths.sort()
+    writer.end_repo(stats, ext_stats, paths)
+    return stats, ext_stats
+
+COMPRESSORS = {
+    '.gz':  lambda path: gzip.open(path, 'wb', compresslevel=3),
+    '.zst': lambda path: zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True),
+}
+
+def open_output(output_file):
+    """Open output_file for binary writing, compressing on the fly for .gz and .zst."""
+    opener = COMPRESSORS.get(os.path.splitext(output_file)[1].lower())
+    if opener is not None:
+        return opener(output_file)
+    return open(output_file, 'wb')
 
 def main():
     parser = argparse.ArgumentParser(description='CodeDigest: Aggregate repository into XML, JSON, or YAML.')
     parser.add_argument('--path',        required=True, help='Repository root path')
-    parser.add_argument('--output',      required=True, help='Output file (.xml, .json, .yaml)')
+    parser.add_argument('--output',      required=True, help='Output file (.xml, .json, .yaml), optionally .gz or .zst')
     parser.add_argument('--timestamp',   action='store_true', help='Append timestamp to filename')
     parser.add_argument('--skip-other',  action='store_true', help='Skip files of type "other"')
     parser.add_argument('--only-text',   action='store_true', help='Include only text files')
@@ -206,14 +648,17 @@ def main():
     parser.add_argument('--version',     action='version', version=f'%(prog)s {__version__}')
     args = parser.parse_args()
 
-    # prepare output filename
+    # prepare output filename, keeping any compression suffix last
+    name, compression = os.path.splitext(args.output)
+    if compression.lower() not in COMPRESSORS:
+        name, compression = args.output, ''
+    base, ext = os.path.splitext(name)
     if args.timestamp:
         ts = datetime.datetime.now().strftime("%Y%m%d%H%M")
-        base, ext = os.path.splitext(args.output)
-        output_file = f"{base}_{ts}{ext}"
+        output_file = f"{base}_{ts}{ext}{compression}"
     else:
         output_file = args.output
-    fmt = os.path.splitext(output_file)[1].lower()
+    fmt = ext.lower()
 
     include_exts     = set(args.include_ext) if args.include_ext else {'.py','.md','.yaml','.yml','.sh','.csv','.txt','.log'}
     exclude_dirs     = set(args.exclude_dir) if args.exclude_dir else {'.git','__pycache__','.venv','node_modules','.idea','docs','outputs'}
@@ -225,6 +670,7 @@ def main():
     print(f"    ├── Input path           : {args.path}")
     print(f"    ├── Output file          : {output_file}")
     print(f"    ├── Output format        : {fmt.upper()[1:]}")
+    print(f"    ├── Compression          : {compression.lower()[1:] or 'None'}")
     print(f"    ├── Timestamp appended   : {'Yes' if args.timestamp else 'No'}")
     print(f"    ├── Include only text    : {'Yes' if args.only_text else 'No'}")
     print(f"    ├── Skip 'other' files   : {'Yes' if args.skip_other else 'No'}")
@@ -233,44 +679,34 @@ def main():
     print(f"    ├── Included extensions  : {sorted(include_exts)}")
     print(f"    └── Excluded directories : {sorted(exclude_dirs)}")
 
+    writer_cls = WRITERS.get(fmt)
+    if writer_cls is None:
+        print("[-] Unsupported format. Use .xml, .json, or .yaml/.yml")
+        return
+    if compression.lower() == '.zst' and zstandard is None:
+        print("[-] .zst output requires zstandard (install with: pip install zstandard)")
+        return
+
+    partial = False   # set while this run holds a half-written output file
     try:
-        # build data structure
-        data = create_code_digest_dict(
-            args.path, include_exts, exclude_dirs,
-            args.skip_other, args.only_text,
-            include_summary, include_structure
-        )
-
-        # write output
-        if fmt == '.xml':
-            tree = create_code_digest_tree(
-                args.path, include_exts, exclude_dirs,
-                args.skip_other, args.only_text,
-                include_summary, include_structure
+        # stream folders and files straight into the output
+        with open_output(output_file) as f:
+            partial = True
+            writer = writer_cls(f, include_summary, include_structure)
+            # the digest must not embed a half-written copy of itself
+            stats, ext_stats = write_code_digest(
+                args.path, writer, include_exts, exclude_dirs,
+                args.skip_other, args.only_text, os.stat(output_file)
             )
-            content = prettify(tree)
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-
-        elif fmt in ('.json', '.yaml', '.yml'):
-            with open(output_file, 'w', encoding='utf-8') as f:
-                if fmt == '.json':
-                    json.dump(data, f, indent=2, ensure_ascii=False)
-                else:
-                    yaml.dump(data, f, allow_unicode=True)
-        else:
-            print("[-] Unsupported format. Use .xml, .json, or .yaml/.yml")
-            return
+        partial = False
 
         size_mb = os.path.getsize(output_file) / (1024*1024)
 
         # terminal stats in nested tree form
         if include_summary:
-            summary   = data['repository'].get('summary', {})
-            ext_stats = data['repository'].get('extension_stats', {})
             print("[+] File Statistics")
             # types
-            types = sorted(summary.items())
+            types = sorted(stats.items())
             print("    ├── By Type:")
             for i, (t, cnt) in enumerate(types):
                 branch = "├──" if i < len(types)-1 else "└──"
@@ -286,6 +722,12 @@ def main():
         print(f"[+] File created successfully: {output_file} ({size_mb:.2f} MB)")
 
     except Exception as e:
+        # never leave a truncated, malformed digest of our own behind
+        if partial:
+            try:
+                os.remove(output_file)
+            except OSError:
+                pass
         print(f"[-] Error during export: {e}")
 
 if __name__ == '__main__':